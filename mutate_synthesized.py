@@ -7,11 +7,16 @@ Usage:
 """
 
 import argparse
+import io
+import logging
+import os
 import sys
-import subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import redirect_stdout
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import json
+import tempfile
 from datetime import datetime
 
 # 项目根目录
@@ -20,15 +25,47 @@ DATA_DIR = ROOT / "data"
 CST_TREE_DIR = ROOT / "cst-tree"
 SPLICE_RUST = CST_TREE_DIR / "splice_rust.py"
 DEFAULT_OUTPUT_DIR = ROOT / "data" / "mutated_synthesized"
+REPORT_FSYNC_EVERY = 100  # 每写入多少条记录 fsync 一次 mutation_report.jsonl
+
+
+def _is_synthesized_file(entry: os.DirEntry) -> bool:
+    return entry.name.startswith("synthesized") and entry.name.endswith(".rs") and entry.is_file()
+
+
+def _scan_synthesized(directory: str) -> List[str]:
+    # os.scandir 递归, 不为每个条目构造 Path; 与 rglob 一样不进入符号链接目录
+    found = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    found.extend(_scan_synthesized(entry.path))
+                elif _is_synthesized_file(entry):
+                    found.append(entry.path)
+    except OSError:
+        pass
+    return found
 
 
 def find_synthesized_files(data_dir: Path = DATA_DIR) -> List[Path]:
     files = []
-    for rs_file in data_dir.rglob("synthesized*.rs"):
-        files.append(rs_file)
+    subdirs = []
+    try:
+        with os.scandir(data_dir) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif _is_synthesized_file(entry):
+                    files.append(entry.path)
+    except OSError:
+        return []
+    
+    # 顶层子目录并行扫描 (I/O 密集, 线程即可)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        for found in executor.map(_scan_synthesized, subdirs):
+            files.extend(found)
     
-    files.sort()  
-    return files
+    return sorted(Path(f) for f in files)
 
 
 def ensure_splice_rust_exists():
@@ -39,43 +76,70 @@ def ensure_splice_rust_exists():
     print(f"✅ Found splice_rust.py at {SPLICE_RUST}")
 
 
+def _load_splice_rust():
+    # 每个 worker 进程只导入一次, tree-sitter 语言库随模块缓存
+    if str(CST_TREE_DIR) not in sys.path:
+        sys.path.insert(0, str(CST_TREE_DIR))
+    from splice_rust import parse_and_replace
+    return parse_and_replace
+
+
 def mutate_file(input_file: Path, output_file: Path, num_mutations: int = 1, 
                 seed: int = 42) -> bool:
 
     try:
-        cmd = [
-            "python3", str(SPLICE_RUST),
-            str(input_file),
-            "--mutations", str(num_mutations),
-            "--seed", str(seed),
-            "--output", str(output_file)
-        ]
+        parse_and_replace = _load_splice_rust()
         
-        print(f"  🔨 Running: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-        
-        if result.returncode != 0:
-            print(f"  ❌ Failed to mutate {input_file.name}")
-            if result.stderr:
-                print(f"     Error: {result.stderr[:200]}")
-            return False
+        print(f"  🔨 Mutating: {input_file} (mutations={num_mutations}, seed={seed})")
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            parse_and_replace(input_file, output_file,
+                              num_mutations=num_mutations, seed=seed)
         
         print(f"  ✅ Mutated {input_file.name} -> {output_file.name}")
         return True
         
-    except subprocess.TimeoutExpired:
-        print(f"  ⏱️  Timeout while mutating {input_file.name}")
+    except SystemExit:
+        print(f"  ❌ Failed to mutate {input_file.name}")
         return False
     except Exception as e:
-        print(f"  ❌ Error: {e}")
+        print(f"  ❌ Failed to mutate {input_file.name}")
+        print(f"     Error: {str(e)[:200]}")
         return False
 
 
+def _mutate_file_worker(input_file: Path, output_file: Path, num_mutations: int,
+                        seed: int, log_level: int = logging.WARNING,
+                        log_file: Optional[Path] = None) -> Tuple[bool, str]:
+    # 在子进程中运行, 捕获输出以免多个 worker 的打印交错
+    # 详细日志直接流式写入 log_file, 不在内存中缓冲; 否则只有少量警告随输出返回
+    buffer = io.StringIO()
+    if log_file is not None:
+        handler = logging.FileHandler(log_file, mode="w", encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+    else:
+        handler = logging.StreamHandler(buffer)
+        handler.setFormatter(logging.Formatter("     %(message)s"))
+    logger = logging.getLogger("splice_rust")
+    logger.setLevel(log_level)
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        with redirect_stdout(buffer):
+            success = mutate_file(input_file, output_file,
+                                  num_mutations=num_mutations, seed=seed)
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+    return success, buffer.getvalue()
+
+
 def process_synthesized_files(data_dir: Path = DATA_DIR,
                              output_dir: Path = DEFAULT_OUTPUT_DIR,
                              num_mutations: int = 1,
                              seed: int = 42,
-                             max_files: Optional[int] = None) -> dict:
+                             max_files: Optional[int] = None,
+                             workers: Optional[int] = None,
+                             log_level: int = logging.WARNING) -> dict:
 
     output_dir.mkdir(parents=True, exist_ok=True)
     print(f" Output directory: {output_dir}")
@@ -98,42 +162,76 @@ def process_synthesized_files(data_dir: Path = DATA_DIR,
     stats = {
         "total": len(files),
         "success": 0,
-        "failed": 0,
-        "files": []
+        "failed": 0
     }
     
-   
-    for i, input_file in enumerate(files, 1):
-        rel_path = input_file.relative_to(data_dir)
-        print(f"[{i}/{len(files)}] Processing: {rel_path}")
-        
-       
-        output_file = output_dir / f"{input_file.stem}_mutated.rs"
-        
-        
-        success = mutate_file(
-            input_file,
-            output_file,
-            num_mutations=num_mutations,
-            seed=seed + i  
-        )
+    # verbose 时每个文件的 splice_rust 日志写到 logs/<stem>.log
+    log_dir = None
+    if log_level < logging.WARNING:
+        log_dir = output_dir / "logs"
+        log_dir.mkdir(parents=True, exist_ok=True)
+        print(f" Log directory: {log_dir}")
+        print()
+    
+    # 每个文件完成后立即追加一行到 mutation_report.jsonl, 崩溃时已完成的记录不丢失
+    records_file = output_dir / "mutation_report.jsonl"
+    print(f" Per-file records: {records_file}")
+    print()
+    
+    # 并行变异: 每个文件独立, seed 按文件序号固定, 与完成顺序无关
+    with open(records_file, "w", buffering=1) as records, \
+            ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {}
+        for i, input_file in enumerate(files, 1):
+            output_file = output_dir / f"{input_file.stem}_mutated.rs"
+            future = executor.submit(
+                _mutate_file_worker,
+                input_file,
+                output_file,
+                num_mutations,
+                seed + i,
+                log_level,
+                log_dir / f"{input_file.stem}.log" if log_dir else None
+            )
+            futures[future] = (i, input_file, output_file)
         
-        if success:
-            stats["success"] += 1
-            stats["files"].append({
-                "input": str(rel_path),
-                "output": f"{output_file.stem}.rs",
-                "status": "success"
-            })
-        else:
-            stats["failed"] += 1
-            stats["files"].append({
-                "input": str(rel_path),
-                "output": None,
-                "status": "failed"
-            })
+        for done, future in enumerate(as_completed(futures), 1):
+            i, input_file, output_file = futures[future]
+            rel_path = input_file.relative_to(data_dir)
+            print(f"[{done}/{len(files)}] Processing: {rel_path}")
+            
+            try:
+                success, output = future.result()
+                print(output, end="")
+            except Exception as e:
+                print(f"  ❌ Error: {e}")
+                success = False
+            
+            if success:
+                stats["success"] += 1
+                record = {
+                    "index": i,
+                    "input": str(rel_path),
+                    "output": f"{output_file.stem}.rs",
+                    "status": "success"
+                }
+            else:
+                stats["failed"] += 1
+                record = {
+                    "index": i,
+                    "input": str(rel_path),
+                    "output": None,
+                    "status": "failed"
+                }
+            
+            records.write(json.dumps(record, separators=(",", ":")) + "\n")
+            if done % REPORT_FSYNC_EVERY == 0:
+                os.fsync(records.fileno())
+            
+            print()
         
-        print()
+        records.flush()
+        os.fsync(records.fileno())
     
     return stats
 
@@ -172,6 +270,18 @@ def main():
         default=DATA_DIR,
         help=f"数据目录 (default: {DATA_DIR})"
     )
+    parser.add_argument(
+        "--workers", "-j",
+        type=int,
+        default=None,
+        help="并行 worker 数 (default: CPU 核数)"
+    )
+    parser.add_argument(
+        "--verbose", "-v",
+        action="count",
+        default=0,
+        help="将 splice_rust 进度 (-v) 或每一步变异 (-vv) 写入 <output-dir>/logs/"
+    )
     
     args = parser.parse_args()
     
@@ -190,15 +300,25 @@ def main():
     print(f"   Base seed: {args.seed}")
     print(f"   Output directory: {args.output_dir}")
     print(f"   Max files: {args.max_files if args.max_files else 'all'}")
+    print(f"   Workers: {args.workers if args.workers else os.cpu_count()}")
     print()
     
+    if args.verbose >= 2:
+        log_level = logging.DEBUG
+    elif args.verbose == 1:
+        log_level = logging.INFO
+    else:
+        log_level = logging.WARNING
+    
     start_time = datetime.now()
     stats = process_synthesized_files(
         data_dir=args.data_dir,
         output_dir=args.output_dir,
         num_mutations=args.mutations,
         seed=args.seed,
-        max_files=args.max_files
+        max_files=args.max_files,
+        workers=args.workers,
+        log_level=log_level
     )
     end_time = datetime.now()
     
@@ -217,8 +337,12 @@ def main():
     stats["timestamp"] = start_time.isoformat()
     stats["duration_seconds"] = (end_time - start_time).total_seconds()
     
-    with open(report_file, "w") as f:
+    # 原子写入汇总 (逐文件记录在 mutation_report.jsonl)
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=args.output_dir, delete=False) as f:
         json.dump(stats, f, indent=2)
+    os.chmod(f.name, 0o644)  # NamedTemporaryFile 默认 0600
+    os.replace(f.name, report_file)
     
     print(f"📊 Report saved to: {report_file}")
     
@@ -9,13 +9,20 @@ Usage: python3 splice_rust.py input.rs [--output output.rs] [--mutations N]
 """
 
 import argparse
+import functools
+import hashlib
+import heapq
+import logging
+import pickle
 import random
+import shutil
 import sys
 import subprocess
 import os
+import tempfile
 from pathlib import Path
 from collections import defaultdict
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional
 
 try:
     from tree_sitter import Language, Parser, Query, Node
@@ -23,17 +30,57 @@ except Exception as e:
     print("tree_sitter Python package not found. Please run: pip install -r requirements.txt", file=sys.stderr)
     raise
 
+try:
+    import xxhash  # Optional, much faster than sha256 for cache keys
+except ImportError:
+    xxhash = None
+
 ROOT = Path(__file__).resolve().parent
 BUILD_DIR = ROOT / "build"
 VENDOR_DIR = ROOT / "vendor"
 RUST_SO = BUILD_DIR / "my-languages.so"
 TREE_SITTER_RUST = VENDOR_DIR / "tree-sitter-rust"
+CACHE_DIR = ROOT / ".cache" / "splice_rust"
+
+log = logging.getLogger(__name__)
+CACHE_FORMAT = 2  # Bump when the cached node pool layout or contents change
+
+# Replacement priority per node type (lower number = higher priority)
+PRIORITY_WEIGHTS: Dict[str, int] = {
+    'block': 1,                 # Code block - most meaningful replacement
+    'binary_expression': 2,     # Binary expression
+    'call_expression': 3,       # Function call
+    'let_declaration': 4,       # Let statement
+    'expression_statement': 5,  # Expression statement
+    'macro_invocation': 6,      # Macro invocation
+    'string_literal': 10,       # Medium priority: literals and argument lists
+    'integer_literal': 11,
+    'parameters': 12,
+    'arguments': 13,
+    'identifier': 20,           # Lowest priority: identifiers
+    'type_identifier': 21,
+}
+DEFAULT_PRIORITY = 15  # Other types are allowed, between medium and low priority
+
+# Identifiers that are never replaced, compared against raw node text
+CRITICAL_FUNCTIONS = frozenset({b'main', b'test'})
+STDLIB_FUNCTIONS = frozenset({b'println', b'print', b'panic', b'vec', b'format'})
+
+# Top-level declarations are never replaced themselves, but their children are explored
+SKIP_BUT_EXPLORE_TYPES = frozenset({
+    'function_item',    # Skip function declaration itself, but explore internals
+    'struct_item',      # Skip struct declaration, but explore internals
+    'impl_item',        # Skip impl block, but explore internals
+    'mod_item',         # Skip module declaration
+    'use_declaration',  # Skip use statement
+    'source_file',      # Skip root node
+})
 
 
 def ensure_language_built():
     """Ensure Rust language library exists, build it if necessary"""
     if RUST_SO.exists():
-        print(f"✅ Language library found at {RUST_SO}")
+        log.info("✅ Language library found at %s", RUST_SO)
         return
     
     print("📦 Building language library...")
@@ -74,44 +121,175 @@ def ensure_language_built():
         sys.exit(1)
 
 
+@functools.lru_cache(maxsize=None)
+def _get_language() -> Language:
+    """Load the Rust language once per process"""
+    ensure_language_built()
+    return Language(str(RUST_SO), "rust")
+
+
+@functools.lru_cache(maxsize=None)
+def _get_parser() -> Parser:
+    """Shared parser, reused across files in the same process"""
+    parser = Parser()
+    parser.set_language(_get_language())
+    return parser
+
+
+def _content_digest(data: bytes) -> str:
+    """Non-cryptographic content hash for cache keys, sha256 if xxhash is not installed"""
+    if xxhash is not None:
+        return xxhash.xxh3_128_hexdigest(data)
+    return hashlib.sha256(data).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _grammar_version() -> str:
+    """Identify the built grammar, so cached node pools are dropped when it changes"""
+    digest = _content_digest(RUST_SO.read_bytes())
+    return f"tree-sitter-rust-{digest[:16]}"
+
+
+@functools.lru_cache(maxsize=None)
+def _ensure_cache_version() -> None:
+    """Wipe the node pool cache if it was written for another grammar or format"""
+    version = f"{CACHE_FORMAT} {_grammar_version()}"
+    version_file = CACHE_DIR / "version"
+    try:
+        if version_file.read_text() == version:
+            return
+    except OSError:
+        pass
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        version_file.write_text(version)
+    except OSError as e:
+        log.warning("⚠️  Cannot initialize node pool cache: %s", e)
+
+
+def _cache_path(digest: str) -> Path:
+    return CACHE_DIR / digest[:2] / f"{digest[2:]}.pkl"
+
+
+def load_cached_pools(digest: str) -> Optional[Dict[str, List[bytes]]]:
+    """Load node pools cached for a source file digest, None on a miss"""
+    _ensure_cache_version()
+    try:
+        with open(_cache_path(digest), "rb") as f:
+            data = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if not isinstance(data, dict) or data.get("grammar") != _grammar_version():
+        return None
+    return data.get("pools")
+
+
+def store_cached_pools(digest: str, pools: Dict[str, List[bytes]]) -> None:
+    """Atomically write node pools for a source file digest"""
+    _ensure_cache_version()
+    path = _cache_path(digest)
+    data = {"grammar": _grammar_version(), "pools": dict(pools)}
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f.name, path)
+    except OSError as e:
+        log.warning("⚠️  Cannot write node pool cache: %s", e)
+
+
+def _end_point(start_point: Tuple[int, int], inserted: bytes) -> Tuple[int, int]:
+    """(row, column) point where inserted text ends, if it starts at start_point"""
+    newlines = inserted.count(b'\n')
+    if newlines == 0:
+        return (start_point[0], start_point[1] + len(inserted))
+    return (start_point[0] + newlines, len(inserted) - inserted.rfind(b'\n') - 1)
+
+
+def _walk_tree(node: Node) -> Iterator[Tuple[Node, int]]:
+    """Pre-order walk of node's subtree with a TreeCursor, yielding (node, depth)"""
+    cursor = node.walk()
+    depth = 0
+    while True:
+        yield cursor.node, depth
+        if cursor.goto_first_child():
+            depth += 1
+            continue
+        # The cursor never leaves the subtree it was created on
+        while not cursor.goto_next_sibling():
+            if not cursor.goto_parent():
+                return
+            depth -= 1
+
+
 class NodeReplacer:
     """Node replacer, similar to tree-splicer functionality"""
     
-    def __init__(self, language: Language, seed: int = 42):
+    def __init__(self, language: Language, seed: int = 42, parser: Optional[Parser] = None):
         self.language = language
-        self.parser = Parser()
-        self.parser.set_language(language)
+        if parser is None:
+            parser = Parser()
+            parser.set_language(language)
+        self.parser = parser
         self.rng = random.Random(seed)
-        self.node_pools: Dict[str, List[bytes]] = defaultdict(list)
-        self.variable_tracker: Dict[str, int] = {}  # Track variable declaration positions
-        self.function_names_used: set = set()  # Track used function names
-        self.priority_order = [  # Node replacement priority order
-            'let_declaration',
-            'identifier', 
-            'binary_expression',
-            'call_expression',
-            'block',
-            'function_item'
-        ]
+        self.node_pools: Dict[str, List[bytes]] = defaultdict(list)  # Unique snippets, list for sampling
+        self._pool_sets: Dict[str, set] = {}  # Same snippets, set for dedup, built lazily while collecting
+        self.function_names_used: set = set()  # Track used function names (raw bytes)
     
     def collect_nodes(self, source_bytes: bytes, tree) -> None:
         """Collect all node types and their corresponding code snippets"""
-        self._collect_recursive(tree.root_node, source_bytes)
-    
-    def _collect_recursive(self, node: Node, source_bytes: bytes) -> None:
-        """Recursively collect nodes"""
-        node_kind = node.type
-        node_text = source_bytes[node.start_byte:node.end_byte]
-        
-        # Only collect meaningful nodes (not too big or too small)
-        if 5 <= len(node_text) <= 200 and not node_kind.startswith('_'):
-            self.node_pools[node_kind].append(node_text)
-        
-        # Recursively process child nodes
-        for i in range(node.child_count):
-            child = node.child(i)
-            if child:
-                self._collect_recursive(child, source_bytes)
+        self._scan_tree(tree.root_node, 0, collect_pools=True)
+    
+    def _scan_tree(self, node: Node, depth: int,
+                   collect_pools: bool = False) -> List[Tuple[int, int, int, int, str]]:
+        """Single pre-order pass over node's subtree
+        
+        Records function names and returns the replaceable candidates as worklist
+        entries; also fills the node pools with collect_pools. Snippets come from
+        node.text, so the tree must be parsed with keep_text (the default).
+        """
+        candidates = []
+        node_pools = self.node_pools
+        pool_sets = self._pool_sets
+        
+        for current, child_depth in _walk_tree(node):
+            node_type = current.type
+            start_byte, end_byte = current.start_byte, current.end_byte
+            
+            # Only collect meaningful nodes (not too big or too small) of kinds that may be replaced
+            if (collect_pools and 5 <= end_byte - start_byte <= 200
+                    and not node_type.startswith('_') and node_type not in SKIP_BUT_EXPLORE_TYPES):
+                node_text = current.text
+                pool_set = pool_sets.get(node_type)
+                if pool_set is None:
+                    pool_set = pool_sets[node_type] = set(node_pools[node_type])
+                if node_text not in pool_set:
+                    pool_set.add(node_text)
+                    node_pools[node_type].append(node_text)
+            
+            if node_type == 'function_item':
+                # Find function name (usually the second child node)
+                for child in current.children:
+                    if child.type == 'identifier':
+                        self.function_names_used.add(child.text)
+                        break
+            elif collect_pools or len(node_pools.get(node_type, ())) > 1:
+                # Pools only hold replaceable kinds, so having candidates in the pool is the whole check
+                candidates.append((PRIORITY_WEIGHTS.get(node_type, DEFAULT_PRIORITY), depth + child_depth,
+                                   start_byte, end_byte, node_type))
+        
+        if collect_pools:
+            # Pools are only complete after the pass, so filter on them last
+            return [entry for entry in candidates if len(node_pools.get(entry[4], ())) > 1]
+        return candidates
+    
+    def load_node_pools(self, pools: Dict[str, List[bytes]]) -> None:
+        """Use node pools collected earlier (e.g. from the cache) instead of collect_nodes"""
+        # Dedup sets are only needed while collecting, so they are not rebuilt here
+        for node_kind, texts in pools.items():
+            self.node_pools[node_kind] = list(texts)
+        self._pool_sets.clear()
     
     def print_node_pools(self) -> None:
         """Print collected node pools"""
@@ -125,358 +303,255 @@ class NodeReplacer:
                 print(f"  [{i}] {preview}")
             print()
     
-    def find_replaceable_nodes_ordered(self, tree) -> List[Node]:
-        """Find replaceable nodes from root node in priority order"""
-        all_candidates = []
-        self._find_replaceable_recursive_ordered(tree.root_node, all_candidates, depth=0)
-        
-        # Sort by priority and depth
-        ordered_candidates = self._sort_by_priority_and_position(all_candidates)
-        
-        # Build variable tracking table
-        self._build_variable_tracker(ordered_candidates)
-        
-        return ordered_candidates
-    
-    def _find_replaceable_recursive_ordered(self, node: Node, candidates: List[Tuple[Node, int]], depth: int) -> None:
-        """Recursively find replaceable nodes, record depth information"""
-        # Only consider node types with replacement candidates
-        if node.type in self.node_pools and len(self.node_pools[node.type]) > 1:
-            candidates.append((node, depth))
-        
-        # Recursively process child nodes
-        for i in range(node.child_count):
-            child = node.child(i)
-            if child:
-                self._find_replaceable_recursive_ordered(child, candidates, depth + 1)
-    
-    def _sort_by_priority_and_position(self, candidates: List[Tuple[Node, int]]) -> List[Node]:
-        """Sort nodes by position, but ensure let_declaration has priority within same scope"""
-        def priority_key(item):
-            node, depth = item
-            node_type = node.type
-            
-            # Sort primarily by position, but let_declaration has priority within same position range
-            base_priority = node.start_byte
-            
-            # let_declaration gets priority within same small range
-            if node_type == 'let_declaration':
-                base_priority -= 0.1  # Slightly ahead
-            
-            return base_priority
-        
-        sorted_candidates = sorted(candidates, key=priority_key)
-        return [node for node, depth in sorted_candidates]
-    
-    def _build_variable_tracker(self, ordered_nodes: List[Node]) -> None:
-        """Build variable tracking table, ensure let_declaration appears before variables of same name"""
-        self.variable_tracker.clear()
-        
-        for i, node in enumerate(ordered_nodes):
-            if node.type == 'let_declaration':
-                # Extract variable name (simplified processing)
-                var_name = self._extract_variable_name_from_let(node)
-                if var_name:
-                    self.variable_tracker[var_name] = i
-                    print(f"Tracking variable declaration: {var_name} at position {i}")
-    
-    def _extract_variable_name_from_let(self, let_node: Node) -> Optional[str]:
-        """Extract variable name from let_declaration node"""
-        # Traverse child nodes to find identifier
-        for i in range(let_node.child_count):
-            child = let_node.child(i)
-            if child and child.type == 'identifier':
-                return child.text.decode('utf-8', errors='replace')
-        return None
-    
-    def _can_replace_identifier(self, node: Node, position: int) -> bool:
-        """Check if identifier node can be replaced"""
-        if node.type != 'identifier':
-            return True
-        
-        var_name = node.text.decode('utf-8', errors='replace')
-        
-        # If this variable has declaration, check if it's after the declaration
-        if var_name in self.variable_tracker:
-            declaration_pos = self.variable_tracker[var_name]
-            if position <= declaration_pos:
-                print(f"Skipping variable {var_name}: declaration position {declaration_pos}, current position {position}")
-                return False
+    def perform_replacement_recursive(self, source_bytes: bytes, tree, num_mutations: int = 1,
+                                      collect_pools: bool = False) -> Optional[bytes]:
+        """Start replacement from root - child nodes change after replacing a node
+        
+        tree must be the parse of source_bytes and is edited in place. With
+        collect_pools, node pools are filled in the same pass instead of by collect_nodes.
+        """
+        # One pass collects function names and the worklist of
+        # (weight, depth, start_byte, end_byte, type) entries. Node pools are
+        # filled at most once and describe the original source only, so
+        # re-collection after a mutation never touches them.
+        self.function_names_used.clear()
+        candidates = self._scan_tree(tree.root_node, 0, collect_pools)
         
-        return True
-    
-    def perform_replacement_recursive(self, source_bytes: bytes, tree, num_mutations: int = 1) -> Optional[bytes]:
-        """Start recursive replacement from root - child nodes change after replacing a node"""
         if num_mutations <= 0:
             return None
             
-        print(f"Starting recursive replacement, max {num_mutations} mutations")
-        
-        # Collect function names in current code
-        self._collect_function_names(tree.root_node, source_bytes)
-        print(f"🔍 Found function names: {self.function_names_used}")
-        
-        # Start recursive search and replacement from root
-        result_bytes = bytearray(source_bytes)
-        mutations_count = [0]  # Use list to modify in recursion
-        
-        # Re-parse to get latest tree structure
-        new_tree = self.parser.parse(bytes(result_bytes))
-        
-        success = self._recursive_replace_from_node(
-            new_tree.root_node, 
-            result_bytes, 
-            mutations_count, 
-            num_mutations,
-            bytes(result_bytes)
-        )
-        
-        if mutations_count[0] == 0:
-            print("No replacements performed")
-            return None
-            
-        print(f"Total {mutations_count[0]} replacements performed")
-        return bytes(result_bytes)
-    
-    def _collect_function_names(self, node: Node, source_bytes: bytes) -> None:
-        """Collect all function names in the code"""
-        self.function_names_used.clear()
-        
-        if node.type == 'function_item':
-            # Find function name (usually the second child node)
-            for i in range(node.child_count):
-                child = node.child(i)
-                if child and child.type == 'identifier':
-                    func_name = source_bytes[child.start_byte:child.end_byte].decode('utf-8', errors='replace')
-                    self.function_names_used.add(func_name)
-                    break
-        
-        # Recursively process child nodes
-        for i in range(node.child_count):
-            child = node.child(i)
-            if child:
-                self._collect_function_names(child, source_bytes)
-    
-    def _recursive_replace_from_node(self, node: Node, result_bytes: bytearray, 
-                                   mutations_count: List[int], max_mutations: int,
-                                   current_source: bytes, depth: int = 0) -> bool:
-        """Recursively replace from specified node - prioritize meaningful nodes"""
-        if mutations_count[0] >= max_mutations:
-            return True  # Reached max replacements
-        
-        indent = "  " * depth
-        print(f"{indent}🔍 Exploring node: {node.type} [{node.start_byte}:{node.end_byte}] (depth {depth})")
-        
-        # First collect all replaceable nodes in current node and its children
-        replaceable_candidates = []
-        self._collect_replaceable_candidates(node, replaceable_candidates, depth)
-        
-        # Sort candidate nodes by priority
-        prioritized_candidates = self._prioritize_candidates(replaceable_candidates)
-        
-        # Try to replace the highest priority node
-        for candidate_node, candidate_depth in prioritized_candidates:
-            if mutations_count[0] >= max_mutations:
-                break
-                
-            print(f"{indent}✅ Selected replacement node: {candidate_node.type} (depth {candidate_depth})")
+        log.info("Starting recursive replacement, max %d mutations", num_mutations)
+        debug = log.isEnabledFor(logging.DEBUG)
+        if debug:
+            log.debug("🔍 Found function names: %s",
+                      {name.decode('utf-8', errors='replace') for name in self.function_names_used})
+        
+        # Start search and replacement from root
+        mutations_count = [0]  # Shared with _try_replace_current_node
+        current_source = source_bytes
+        current_tree = tree
+        heapq.heapify(candidates)
+        
+        while mutations_count[0] < num_mutations:
+            if debug:
+                log.debug("🔍 Exploring %d candidates", len(candidates))
             
-            if self._try_replace_current_node(candidate_node, result_bytes, mutations_count, current_source, candidate_depth):
-                print(f"{indent}🔄 Replaced {candidate_node.type}, re-parsing entire file")
+            # Pop the highest priority node until one can be replaced
+            tried = []
+            replaced = None
+            replacement = None
+            while candidates:
+                entry = heapq.heappop(candidates)
+                _, candidate_depth, start_byte, end_byte, node_type = entry
+                candidate_node = self._resolve_candidate(current_tree.root_node, start_byte, end_byte, node_type)
+                if candidate_node is None:
+                    continue  # Stale entry, the node no longer exists
+                tried.append(entry)
                 
-                # Re-parse entire file after replacement
-                new_source = bytes(result_bytes)
-                new_tree = self.parser.parse(new_source)
+                if debug:
+                    log.debug("✅ Selected replacement node: %s (depth %d)", node_type, candidate_depth)
                 
-                # Start over from root node
-                return self._recursive_replace_from_node(
-                    new_tree.root_node, 
-                    result_bytes, 
-                    mutations_count, 
-                    max_mutations,
-                    new_source,
-                    depth=0  # Start over, reset depth to 0
-                )
-        
-        return False  # No replacements occurred
-    
-    def _collect_replaceable_candidates(self, node: Node, candidates: List, depth: int) -> None:
-        """Collect all replaceable candidate nodes in current node and its subtree"""
-        # Check current node
-        if self._can_replace_node(node):
-            candidates.append((node, depth))
-        
-        # Recursively collect child nodes
-        for i in range(node.child_count):
-            child = node.child(i)
-            if child:
-                self._collect_replaceable_candidates(child, candidates, depth + 1)
-    
-    def _prioritize_candidates(self, candidates: List) -> List:
-        """Sort candidate nodes by priority"""
-        def get_priority(item):
-            node, depth = item
-            node_type = node.type
+                replacement = self._try_replace_current_node(candidate_node, mutations_count, current_source, candidate_depth)
+                if replacement is not None:
+                    replaced = candidate_node
+                    break
+            
+            if replaced is None:
+                break  # No replacements possible
             
-            # Define priority weights (lower number = higher priority)
-            priority_weights = {
-                'block': 1,              # Highest priority
-                'binary_expression': 2,
-                'call_expression': 3,
-                'let_declaration': 4,
-                'expression_statement': 5,
-                'macro_invocation': 6,
-                'string_literal': 10,    # Medium priority
-                'integer_literal': 11,
-                'parameters': 12,
-                'arguments': 13,
-                'identifier': 20,        # Lowest priority
-                'type_identifier': 21,
-            }
+            if debug:
+                log.debug("🔄 Replaced %s, re-parsing incrementally", replaced.type)
             
-            weight = priority_weights.get(node_type, 15)  # Default medium priority
+            # Splice with a single copy, then tell tree-sitter which byte range changed
+            # and re-parse reusing the old tree
+            start_byte, old_end_byte = replaced.start_byte, replaced.end_byte
+            new_end_byte = start_byte + len(replacement)
+            new_source = b"".join((current_source[:start_byte], replacement, current_source[old_end_byte:]))
+            current_tree.edit(
+                start_byte=start_byte,
+                old_end_byte=old_end_byte,
+                new_end_byte=new_end_byte,
+                start_point=replaced.start_point,
+                old_end_point=replaced.end_point,
+                new_end_point=_end_point(replaced.start_point, replacement),
+            )
+            new_tree = self.parser.parse(new_source, current_tree)
             
-            # For same priority, prefer shallower nodes
-            return (weight, depth)
+            # Only the replaced node and the ranges tree-sitter reports as changed need re-collecting
+            changed = [(start_byte, new_end_byte)]
+            changed.extend((r.start_byte, r.end_byte) for r in current_tree.changed_ranges(new_tree))
+            candidates = self._update_candidates(
+                candidates + tried, new_tree.root_node, start_byte, old_end_byte, new_end_byte, changed
+            )
+            
+            current_source = new_source
+            current_tree = new_tree
         
-        return sorted(candidates, key=get_priority)
-    
-    def _can_replace_node(self, node: Node) -> bool:
-        """Check if node can be replaced - prioritize meaningful large-grain nodes"""
-        if node.type not in self.node_pools:
-            return False
-        if len(self.node_pools[node.type]) <= 1:
-            return False
-        if node.type.startswith('_'):
-            return False
+        if mutations_count[0] == 0:
+            log.info("No replacements performed")
+            return None
             
-        # Skip top-level declarations but don't block deep exploration
-        skip_but_explore_types = {
-            'function_item',    # Skip function declaration itself, but explore internals
-            'struct_item',      # Skip struct declaration, but explore internals 
-            'impl_item',        # Skip impl block, but explore internals
-            'mod_item',         # Skip module declaration
-            'use_declaration',  # Skip use statement
-            'source_file',      # Skip root node
-        }
-        
-        if node.type in skip_but_explore_types:
-            return False  # Don't replace these nodes themselves, but continue exploring child nodes
-        
-        # Define node priority: prioritize large-grain, meaningful nodes
-        high_priority_types = {
-            'block',               # Code block - most meaningful replacement
-            'binary_expression',   # Binary expression 
-            'call_expression',     # Function call
-            'let_declaration',     # Let statement
-            'expression_statement', # Expression statement
-            'macro_invocation',    # Macro invocation
-        }
-        
-        medium_priority_types = {
-            'string_literal',      # String literal
-            'integer_literal',     # Integer literal
-            'parameters',          # Parameter list
-            'arguments',           # Arguments
-        }
-        
-        low_priority_types = {
-            'identifier',          # Identifier - consider last
-            'type_identifier',     # Type identifier
-        }
-        
-        # Prioritize high priority nodes
-        if node.type in high_priority_types:
-            return True
-        elif node.type in medium_priority_types:
-            return True  
-        elif node.type in low_priority_types:
-            return True
-        else:
-            return True  # Other types also allowed, but lower priority
+        log.info("Total %d replacements performed", mutations_count[0])
+        return current_source
+    
+    def _resolve_candidate(self, root: Node, start_byte: int, end_byte: int, node_type: str) -> Optional[Node]:
+        """Find the node of a worklist entry in the current tree"""
+        node = root.descendant_for_byte_range(start_byte, end_byte)
+        while node is not None and node.start_byte == start_byte and node.end_byte == end_byte:
+            if node.type == node_type:
+                return node
+            node = node.parent
+        return None
     
-    def _try_replace_current_node(self, node: Node, result_bytes: bytearray, 
-                                 mutations_count: List[int], current_source: bytes, depth: int) -> bool:
-        """Try to replace current node"""
+    def _find_covering_node(self, root: Node, start_byte: int, end_byte: int) -> Tuple[Node, int]:
+        """Find the shallowest node spanning exactly the smallest range that covers [start_byte, end_byte]"""
+        cursor = root.walk()
+        depth = 0
+        covering, covering_depth = root, 0
+        
+        while cursor.goto_first_child():
+            while not (cursor.node.start_byte <= start_byte and end_byte <= cursor.node.end_byte):
+                if not cursor.goto_next_sibling():
+                    return covering, covering_depth
+            depth += 1
+            node = cursor.node
+            if node.start_byte != covering.start_byte or node.end_byte != covering.end_byte:
+                covering, covering_depth = node, depth
+        
+        return covering, covering_depth
+    
+    def _update_candidates(self, candidates: List[Tuple[int, int, int, int, str]], root: Node,
+                           start_byte: int, old_end_byte: int, new_end_byte: int,
+                           changed_ranges: List[Tuple[int, int]]) -> List[Tuple[int, int, int, int, str]]:
+        """Patch the worklist after a splice instead of re-collecting the whole tree"""
+        delta = new_end_byte - old_end_byte
+        
+        # Shift entries after the splice, drop the ones inside the replaced node
+        shifted = []
+        for weight, depth, start, end, node_type in candidates:
+            if start >= old_end_byte:
+                start += delta
+                end += delta
+            elif start >= start_byte:
+                continue
+            elif end >= old_end_byte:
+                end += delta  # Ancestor spanning the splice
+            shifted.append((weight, depth, start, end, node_type))
+        
+        # Re-collect the subtrees covering each changed range
+        covering_nodes = []
+        for range_start, range_end in sorted(changed_ranges, key=lambda r: (r[0], -r[1])):
+            node, depth = self._find_covering_node(root, range_start, range_end)
+            if any(other.start_byte <= node.start_byte and node.end_byte <= other.end_byte and other_depth <= depth
+                   for other, other_depth in covering_nodes):
+                continue  # Already inside a re-collected subtree
+            covering_nodes.append((node, depth))
+        
+        for node, node_depth in covering_nodes:
+            node_start, node_end = node.start_byte, node.end_byte
+            shifted = [
+                entry for entry in shifted
+                if not (node_start <= entry[2] and entry[3] <= node_end
+                        and (entry[1] > node_depth or (entry[2], entry[3]) == (node_start, node_end)))
+            ]
+        
+        updated = set(shifted)
+        for node, node_depth in covering_nodes:
+            updated.update(self._scan_tree(node, node_depth))
+        
+        updated = list(updated)
+        heapq.heapify(updated)
+        return updated
+    
+    def _try_replace_current_node(self, node: Node, mutations_count: List[int],
+                                 current_source: bytes, depth: int) -> Optional[bytes]:
+        """Try to replace current node, returning the chosen replacement text"""
         node_type = node.type
         candidates = self.node_pools[node_type]
         
         if len(candidates) <= 1:
-            return False
+            return None
         
         # Get original text
-        original_text = current_source[node.start_byte:node.end_byte]
-        
-        # Choose a different candidate
-        replacement_candidates = [c for c in candidates if c != original_text]
-        if not replacement_candidates:
-            return False
-        
-        replacement = self.rng.choice(replacement_candidates)
+        original_text = node.text
+        
+        # Choose a different candidate; pools are deduplicated, so a few retries suffice.
+        # Draws stay on the seeded random.Random so a given --seed reproduces its output.
+        choice = self.rng.choice
+        for _ in range(3):
+            replacement = choice(candidates)
+            if replacement != original_text:
+                break
+        else:
+            return None
         
         # Check variable declaration order and function name safety
         if node_type == 'identifier':
-            var_name = original_text.decode('utf-8', errors='replace')
-            
             # Basic safety check
-            if not self._is_safe_identifier_replacement(var_name, node.start_byte):
-                print(f"{'  ' * depth}⚠️  Skipping unsafe identifier replacement: {var_name}")
-                return False
+            if not self._is_safe_identifier_replacement(original_text, node.start_byte):
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("%s⚠️  Skipping unsafe identifier replacement: %s", '  ' * depth,
+                              original_text.decode('utf-8', errors='replace'))
+                return None
             
             # Check if it's a function name (simple heuristic: check if parent node is function_item)
             if self._is_function_name(node, current_source):
-                replacement_name = replacement.decode('utf-8', errors='replace')
-                if not self._is_safe_function_name_replacement(var_name, replacement_name):
-                    print(f"{'  ' * depth}⚠️  Skipping unsafe function name replacement: {var_name} → {replacement_name}")
-                    return False
+                if not self._is_safe_function_name_replacement(original_text, replacement):
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("%s⚠️  Skipping unsafe function name replacement: %s → %s", '  ' * depth,
+                                  original_text.decode('utf-8', errors='replace'),
+                                  replacement.decode('utf-8', errors='replace'))
+                    return None
+        
+        if log.isEnabledFor(logging.DEBUG):
+            indent = "  " * depth
+            original_preview = original_text.decode('utf-8', errors='replace').replace('\n', '\\n')
+            replacement_preview = replacement.decode('utf-8', errors='replace').replace('\n', '\\n')
+            log.debug("%s🎯 [Replacement #%d] %s (depth %d)", indent, mutations_count[0] + 1, node_type, depth)
+            log.debug("%s   Position: %d-%d", indent, node.start_byte, node.end_byte)
+            log.debug("%s   Original: '%s'", indent, original_preview)
+            log.debug("%s   Replace with: '%s'", indent, replacement_preview)
         
-        indent = "  " * depth
-        print(f"{indent}🎯 [Replacement #{mutations_count[0] + 1}] {node_type} (depth {depth})")
-        print(f"{indent}   Position: {node.start_byte}-{node.end_byte}")
-        
-        original_preview = original_text.decode('utf-8', errors='replace').replace('\n', '\\n')
-        replacement_preview = replacement.decode('utf-8', errors='replace').replace('\n', '\\n')
-        print(f"{indent}   Original: '{original_preview}'")
-        print(f"{indent}   Replace with: '{replacement_preview}'")
-        
-        # Perform replacement
-        result_bytes[node.start_byte:node.end_byte] = replacement
         mutations_count[0] += 1
         
-        return True
+        return replacement
     
-    def _is_safe_identifier_replacement(self, var_name: str, position: int) -> bool:
+    def _is_safe_identifier_replacement(self, var_name: bytes, position: int) -> bool:
         """Check identifier replacement safety"""
         # Protect critical function names
-        critical_functions = {'main', 'test'}
-        if var_name in critical_functions:
-            print(f"🛡️  Protecting critical function name: {var_name}")
+        if var_name in CRITICAL_FUNCTIONS:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("🛡️  Protecting critical function name: %s", var_name.decode('utf-8', errors='replace'))
             return False
         
         # Protect standard library function names
-        stdlib_functions = {'println', 'print', 'panic', 'vec', 'format'}
-        if var_name in stdlib_functions:
-            print(f"🛡️  Protecting standard library function name: {var_name}")
+        if var_name in STDLIB_FUNCTIONS:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("🛡️  Protecting standard library function name: %s", var_name.decode('utf-8', errors='replace'))
             return False
             
         return True
     
-    def _is_safe_function_name_replacement(self, current_name: str, new_name: str) -> bool:
+    def _is_safe_function_name_replacement(self, current_name: bytes, new_name: bytes) -> bool:
         """Check if function name replacement is safe"""
         # Protect main function
-        if current_name == 'main':
-            print(f"🛡️  Cannot replace main function name")
+        if current_name == b'main':
+            log.debug("🛡️  Cannot replace main function name")
             return False
         
+        if new_name == current_name:
+            return True
+        
         # Prevent function name duplication
-        if new_name in self.function_names_used and new_name != current_name:
-            print(f"🛡️  Avoiding duplicate function name: {new_name}")
+        if new_name in self.function_names_used:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("🛡️  Avoiding duplicate function name: %s", new_name.decode('utf-8', errors='replace'))
             return False
         
         # Protect critical function names
-        critical_functions = {'main', 'test'}
-        if new_name in critical_functions and current_name != new_name:
-            print(f"🛡️  Cannot use critical function name: {new_name}")
+        if new_name in CRITICAL_FUNCTIONS:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("🛡️  Cannot use critical function name: %s", new_name.decode('utf-8', errors='replace'))
             return False
             
         return True
@@ -520,7 +595,7 @@ class NodeReplacer:
         print(f"✅ Found block at position {function_block.start_byte}-{function_block.end_byte}")
         
         # Get the original block text
-        original_block = source_bytes[function_block.start_byte:function_block.end_byte]
+        original_block = function_block.text
         print(f"📝 Original block:\n{original_block.decode('utf-8', errors='replace')}\n")
         
         # Get list of other blocks to replace with
@@ -554,15 +629,9 @@ class NodeReplacer:
     
     def _find_first_function_item(self, node: Node) -> Optional[Node]:
         """Find the first function_item node in the tree"""
-        if node.type == 'function_item':
-            return node
-        
-        for i in range(node.child_count):
-            child = node.child(i)
-            if child:
-                result = self._find_first_function_item(child)
-                if result:
-                    return result
+        for current, _ in _walk_tree(node):
+            if current.type == 'function_item':
+                return current
         
         return None
     
@@ -579,44 +648,49 @@ class NodeReplacer:
 def parse_and_replace(input_path: Path, output_path: Optional[Path] = None, 
                      num_mutations: int = 16, seed: int = 42) -> None:
     """Parse and replace code"""
-    ensure_language_built()
-    
-    # Load language
-    RUST = Language(str(RUST_SO), "rust")
+    RUST = _get_language()
+    parser = _get_parser()
     
     # Read input file
     source_bytes = input_path.read_bytes()
     
     # Parse
-    parser = Parser()
-    parser.set_language(RUST)
     tree = parser.parse(source_bytes)
     
-    print(f"Parsing file: {input_path}")
-    print(f"File size: {len(source_bytes)} bytes")
-    print()
-    
-    # Create replacer and collect nodes
-    replacer = NodeReplacer(RUST, seed)
-    replacer.collect_nodes(source_bytes, tree)
-    replacer.print_node_pools()
-    
-    # Perform replacement
-    result = replacer.perform_replacement_recursive(source_bytes, tree, num_mutations)
+    log.info("Parsing file: %s", input_path)
+    log.info("File size: %d bytes", len(source_bytes))
+    
+    # Create replacer, reusing cached pools for unchanged files
+    replacer = NodeReplacer(RUST, seed, parser)
+    digest = _content_digest(source_bytes)
+    pools = load_cached_pools(digest)
+    if pools is not None:
+        log.info("📦 Loaded node pools from cache")
+        replacer.load_node_pools(pools)
+        if log.isEnabledFor(logging.DEBUG):
+            replacer.print_node_pools()
+    
+    # Perform replacement; on a cache miss the pools are collected in the same tree pass
+    result = replacer.perform_replacement_recursive(source_bytes, tree, num_mutations,
+                                                    collect_pools=pools is None)
+    if pools is None:
+        store_cached_pools(digest, replacer.node_pools)
+        if log.isEnabledFor(logging.DEBUG):
+            replacer.print_node_pools()
     
     if result is None:
-        print("No replacement result generated")
+        log.warning("No replacement result generated")
         return
     
     # Verify if replaced code can be parsed
     try:
         new_tree = parser.parse(result)
         if new_tree.root_node.has_error:
-            print("⚠️  Replaced code has syntax errors")
+            log.warning("⚠️  Replaced code has syntax errors")
         else:
-            print("✅ Replaced code is syntactically correct")
+            log.info("✅ Replaced code is syntactically correct")
     except Exception as e:
-        print(f"⚠️  Error verifying replacement result: {e}")
+        log.warning("⚠️  Error verifying replacement result: %s", e)
     
     # Output result
     if output_path:
@@ -630,17 +704,13 @@ def parse_and_replace(input_path: Path, output_path: Optional[Path] = None,
 def parse_and_replace_first_function_block(input_path: Path, output_path: Optional[Path] = None, 
                                            seed: int = 42) -> None:
     """Parse and replace the block of the first function_item with other blocks"""
-    ensure_language_built()
-    
-    # Load language
-    RUST = Language(str(RUST_SO), "rust")
+    RUST = _get_language()
+    parser = _get_parser()
     
     # Read input file
     source_bytes = input_path.read_bytes()
     
     # Parse
-    parser = Parser()
-    parser.set_language(RUST)
     tree = parser.parse(source_bytes)
     
     print(f"📖 Parsing file: {input_path}")
@@ -648,7 +718,7 @@ def parse_and_replace_first_function_block(input_path: Path, output_path: Option
     print()
     
     # Create replacer
-    replacer = NodeReplacer(RUST, seed)
+    replacer = NodeReplacer(RUST, seed, parser)
     
     # Replace first function's block
     result = replacer.replace_first_function_block(source_bytes, tree)
@@ -676,9 +746,19 @@ def main():
     parser.add_argument("--seed", "-s", type=int, default=42, help="Random seed (default: 42)")
     parser.add_argument("--replace-first-block", action="store_true", 
                        help="Replace the block of the first function_item with other blocks")
+    parser.add_argument("--verbose", "-v", action="count", default=0,
+                       help="Show progress (-v) or every mutation step (-vv)")
     
     args = parser.parse_args()
     
+    if args.verbose >= 2:
+        level = logging.DEBUG
+    elif args.verbose == 1:
+        level = logging.INFO
+    else:
+        level = logging.WARNING
+    logging.basicConfig(level=level, format="%(message)s")
+    
     input_path = Path(args.input)
     if not input_path.exists():
         print(f"❌ File does not exist: {input_path}")